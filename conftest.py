@@ -0,0 +1,30 @@
+"""
+conftest.py
+===========
+pytest-inställningar för tests.py. Används bara när testerna körs via pytest,
+t.ex. `python tests.py` med pytest-xdist installerat eller
+`pytest tests.py -n auto --dist loadgroup`.
+
+Testklasserna är oberoende och kan köras parallellt, utom TestSQLiteUpsert som
+delar en in-memory-databas mellan sina tester. Den hålls på en och samma
+xdist-worker via en xdist_group-markering (kräver --dist loadgroup).
+"""
+
+import pytest
+
+# Testklasser vars tester måste köras i samma process.
+SERIAL_CLASSES = {"TestSQLiteUpsert": "sqlite"}
+
+
+def pytest_configure(config):
+    # Registrera markeringen även när pytest-xdist inte är installerat.
+    config.addinivalue_line("markers", "xdist_group(name): kör testerna på samma xdist-worker")
+
+
+# tryfirst: markeringen måste finnas innan pytest-xdist grupperar testerna.
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config, items):
+    for item in items:
+        group = SERIAL_CLASSES.get(getattr(item.cls, "__name__", ""))
+        if group:
+            item.add_marker(pytest.mark.xdist_group(name=group))
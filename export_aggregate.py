@@ -9,19 +9,43 @@ Exempel:
 
 import os
 import csv
-import json
 import argparse
+from functools import partial
+from itertools import chain
 from pathlib import Path
 from datetime import datetime, timedelta
+from typing import Callable, List
 
+import orjson
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+
+from main import set_sqlite_pragmas
 
 BASE_DIR = Path(__file__).resolve().parent
 load_dotenv(BASE_DIR / ".env")
 
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///weather.db")
-DEFAULT_LOCATION = os.getenv("VC_LOCATION", "Kungsbacka")
+# VC_LOCATION kan lista flera platser separerade med semikolon; exporten
+# använder den första som default.
+DEFAULT_LOCATION = (os.getenv("VC_LOCATION") or "Kungsbacka").split(";")[0].strip()
+
+# Antal rader per hämtning från databasen när resultatet strömmas till fil.
+FETCH_BATCH_ROWS = 1000
+
+# Skrivbuffert för exportfilen (1 MiB i stället för standard 8 KiB → färre write-anrop).
+WRITE_BUFFER_SIZE = 1 << 20
+
+# SQLite-inställningar för exporten: aggregeringen läser hela intervallet, så
+# större sid-cache, mmap och temp-tabeller i minnet ger mest effekt. WAL och
+# synchronous=NORMAL matchar main.py så att jobbet och exporten inte krockar.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-200000",     # ~200 MB sid-cache (negativt värde = KiB)
+    "PRAGMA mmap_size=268435456",    # 256 MB minnesmappad läsning
+)
 
 
 def detect_day_expr(dialect_name: str) -> str:
@@ -42,6 +66,70 @@ def parse_date(s: str) -> datetime:
     return datetime.fromisoformat(s)
 
 
+def _json_default(o):
+    # orjson hanterar date/datetime själv; övriga typer (t.ex. Decimal) blir text.
+    return o.isoformat() if hasattr(o, "isoformat") else str(o)
+
+
+def day_formatter(value) -> Callable[[object], str]:
+    """
+    Väljer formatering för dag-kolumnen utifrån typen på första raden:
+    date/datetime → isoformat, annars str (SQLite ger redan 'YYYY-MM-DD').
+    """
+    return type(value).isoformat if hasattr(value, "isoformat") else str
+
+
+def write_csv(out_path: Path, fieldnames: List[str], rows) -> int:
+    """
+    Skriver rader (mappings) till CSV. Raderna omvandlas i en generator och
+    skrivs med csv.writer.writerows, så hela loopen körs i C-skrivaren utan att
+    resultatet byggs upp i minnet. Returnerar antal rader.
+    """
+    day_idx = fieldnames.index("day")
+    rows = iter(rows)
+    first = next(rows, None)
+    n = 0
+
+    def _gen():
+        nonlocal n
+        if first is None:
+            return
+        # Dagens typ är densamma för alla rader → välj formatering en gång.
+        fmt_day = day_formatter(first["day"])
+        for r in chain([first], rows):
+            # Kolumnerna kommer redan i SELECT-ordning → ingen dict per rad.
+            row = list(r.values())
+            row[day_idx] = fmt_day(row[day_idx])
+            n += 1
+            yield row
+
+    # utf-8-sig (BOM) så Excel visar å/ä/ö korrekt
+    with open(out_path, "w", newline="", encoding="utf-8-sig", buffering=WRITE_BUFFER_SIZE) as f:
+        w = csv.writer(f)
+        w.writerow(fieldnames)
+        w.writerows(_gen())
+    return n
+
+
+def write_json(out_path: Path, rows) -> int:
+    """
+    Skriver rader (mappings) som en JSON-array, ett element i taget med orjson.
+    Formatet blir detsamma som json.dump(..., indent=2) men utan att hela
+    resultatet byggs upp i minnet först. Returnerar antal rader.
+    """
+    n = 0
+    # orjson ger UTF-8-bytes → skriv binärt direkt utan omkodning.
+    with open(out_path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(b"[")
+        for r in rows:
+            f.write(b",\n  " if n else b"\n  ")
+            item = orjson.dumps(dict(r), default=_json_default, option=orjson.OPT_INDENT_2)
+            f.write(item.replace(b"\n", b"\n  "))
+            n += 1
+        f.write(b"\n]" if n else b"]")
+    return n
+
+
 def main():
     p = argparse.ArgumentParser(description="Exportera DAGLIGA aggregat från weather_hourly.")
     rng = p.add_mutually_exclusive_group()
@@ -85,12 +173,16 @@ def main():
     # DB
     connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
     engine = create_engine(DB_URL, pool_pre_ping=True, connect_args=connect_args)
+    if DB_URL.startswith("sqlite"):
+        event.listen(engine, "connect", partial(set_sqlite_pragmas, SQLITE_PRAGMAS))
     day_expr = detect_day_expr(engine.dialect.name)
 
     where_loc = "AND location = :loc" if args.location else ""
+    # Dag-uttrycket beräknas en gång per rad i subfrågan och återanvänds i
+    # GROUP BY. BETWEEN ger samma inklusiva intervall som tidigare (>= och <=).
     sql = f"""
         SELECT
-            {day_expr} AS day,
+            day,
             location,
             MIN(temp)                            AS temp_min,
             AVG(temp)                            AS temp_avg,
@@ -103,44 +195,38 @@ def main():
             AVG(COALESCE(pressure, 0))           AS pressure_avg,
             AVG(COALESCE(cloudcover, 0))         AS cloudcover_avg,
             COUNT(*)                              AS hours_count
-        FROM weather_hourly
-        WHERE timestamp_local >= :dt_from
-          AND timestamp_local <= :dt_to
-          {where_loc}
-        GROUP BY {day_expr}, location
+        FROM (
+            SELECT {day_expr} AS day, *
+            FROM weather_hourly
+            WHERE timestamp_local BETWEEN :dt_from AND :dt_to
+              {where_loc}
+        ) AS h
+        GROUP BY day, location
         ORDER BY day, location
     """
     params = {"dt_from": dt_from, "dt_to": dt_to}
     if args.location:
         params["loc"] = args.location
 
+    # Strömma resultatet direkt till fil i stället för att samla alla rader i en lista.
     with engine.connect() as conn:
-        rows = list(conn.execute(text(sql), params).mappings())
-
-    if not rows:
-        print("Inga rader att exportera för valt intervall/plats.")
-        return 0
-
-    # Skriv fil
-    if args.format == "csv":
-        # utf-8-sig (BOM) så Excel visar å/ä/ö korrekt
-        with open(out_path, "w", newline="", encoding="utf-8-sig") as f:
-            fieldnames = list(rows[0].keys())
-            w = csv.DictWriter(f, fieldnames=fieldnames)
-            w.writeheader()
-            for r in rows:
-                r = dict(r)
-                d = r["day"]
-                if hasattr(d, "isoformat"):
-                    r["day"] = d.isoformat()
-                w.writerow(r)
-    else:
-        with open(out_path, "w", encoding="utf-8") as f:
-            def _default(o):
-                return o.isoformat() if hasattr(o, "isoformat") else str(o)
-            json.dump(rows, f, ensure_ascii=False, indent=2, default=_default)
-
-    print(f"Skrev {len(rows)} rader till: {out_path}")
+        result = (
+            conn.execution_options(yield_per=FETCH_BATCH_ROWS)
+            .execute(text(sql), params)
+            .mappings()
+        )
+        first = result.fetchone()
+        if first is None:
+            print("Inga rader att exportera för valt intervall/plats.")
+            return 0
+
+        rows = chain([first], result)
+        if args.format == "csv":
+            n = write_csv(out_path, list(result.keys()), rows)
+        else:
+            n = write_json(out_path, rows)
+
+    print(f"Skrev {n} rader till: {out_path}")
     return 0
 
 
@@ -15,7 +15,8 @@ Schemalägg i Task Scheduler:
 
 Miljövariabler (.env):
     VC_API_KEY    – Visual Crossing API-nyckel (OBLIGATORISK)
-    VC_LOCATION   – t.ex. "Kungsbacka" (default)
+    VC_LOCATION   – t.ex. "Kungsbacka" (default). Flera platser separeras med
+                    semikolon, t.ex. "Kungsbacka;Göteborg;London,UK"
     VC_UNIT_GROUP – "metric" eller "us" (default: metric)
     DATABASE_URL  – t.ex. "sqlite:///weather.db" (default)
 
@@ -32,18 +33,23 @@ import sys
 import time
 import random
 import logging
-from datetime import datetime, timedelta, timezone
+from functools import partial
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import quote
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError, Timeout, ConnectionError
 from dotenv import load_dotenv
 
-from sqlalchemy import create_engine, Column, String, Float, DateTime, func, text
-from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy import create_engine, event, Column, String, Float, DateTime, func, text
+from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.exc import OperationalError, SQLAlchemyError
-from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine import Engine
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -52,38 +58,72 @@ from sqlalchemy.engine import Engine
 
 BASE_DIR = Path(__file__).resolve().parent
 LOG_DIR = BASE_DIR / "logs"
-LOG_DIR.mkdir(exist_ok=True)
-
-# Fil-logg i UTF-8 (Windows visar å/ä/ö korrekt i t.ex. Notepad)
-logging.basicConfig(
-    filename=LOG_DIR / "weather_job.log",
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(message)s",
-    encoding="utf-8",
-)
-# Konsol-logg (bra vid manuell körning). För Task Scheduler hamnar allt i task.log.
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-logging.getLogger().addHandler(console)
+
+# Schemaversion som sparas i databasen (SQLite: PRAGMA user_version) när tabell
+# och index är skapade. Höj värdet när schemat ändras.
+SCHEMA_VERSION = 2
 
 # Läs .env explicit från projektmappen (inte från aktuell arbetskatalog)
 load_dotenv(BASE_DIR / ".env")
 
 API_KEY: str = (os.getenv("VC_API_KEY") or "").strip()
-LOCATION: str = (os.getenv("VC_LOCATION") or "Kungsbacka").strip()
+# Semikolon som avgränsare eftersom VC-platser själva kan innehålla komma ("London,UK").
+LOCATIONS: List[str] = [
+    loc.strip() for loc in (os.getenv("VC_LOCATION") or "Kungsbacka").split(";") if loc.strip()
+]
 UNIT_GROUP: str = (os.getenv("VC_UNIT_GROUP") or "metric").strip()  # "metric" eller "us"
 DB_URL: str = (os.getenv("DATABASE_URL") or "sqlite:///weather.db").strip()
 
-if not API_KEY or API_KEY.upper().startswith(("DIN_", "YOUR_")):
-    # Gör felet explicit och lätt att förstå i schemalagd körning.
-    raise RuntimeError(
-        "Ogiltig VC_API_KEY. Lägg in din Visual Crossing-nyckel i .env (VC_API_KEY=...)."
-    )
+# Sätts när loggningen är uppsatt, så att flera main()-anrop i samma process
+# inte lägger till en ny konsol-handler (och dubbla loggrader) varje gång.
+_logging_configured = False
 
-safe_key = API_KEY[:4] + "..." + API_KEY[-4:] if len(API_KEY) > 8 else "(kort)"
-logging.info(
-    "Startar jobb – plats: %s, enheter: %s, VC_API_KEY: %s", LOCATION, UNIT_GROUP, safe_key
-)
+
+def _init_env() -> None:
+    """
+    Sätter upp loggning (en gång per process) och validerar VC_API_KEY. Anropas
+    från main() i stället för vid import, så att tester och andra skript kan
+    importera modulen utan att skriva loggfiler eller kräva en giltig API-nyckel.
+
+    Raises:
+        RuntimeError: Om VC_API_KEY saknas eller fortfarande är en platshållare,
+            eller om VC_LOCATION inte innehåller någon plats.
+    """
+    global _logging_configured
+    if not _logging_configured:
+        LOG_DIR.mkdir(exist_ok=True)
+
+        # Fil-logg i UTF-8 (Windows visar å/ä/ö korrekt i t.ex. Notepad)
+        logging.basicConfig(
+            filename=LOG_DIR / "weather_job.log",
+            level=logging.INFO,
+            format="%(asctime)s %(levelname)s %(message)s",
+            encoding="utf-8",
+        )
+        # Konsol-logg (bra vid manuell körning). För Task Scheduler hamnar allt i task.log.
+        console = logging.StreamHandler()
+        console.setLevel(logging.INFO)
+        logging.getLogger().addHandler(console)
+        _logging_configured = True
+
+    if not API_KEY or API_KEY.upper().startswith(("DIN_", "YOUR_")):
+        # Gör felet explicit och lätt att förstå i schemalagd körning.
+        raise RuntimeError(
+            "Ogiltig VC_API_KEY. Lägg in din Visual Crossing-nyckel i .env (VC_API_KEY=...)."
+        )
+
+    if not LOCATIONS:
+        # T.ex. VC_LOCATION=" ; " – annars ThreadPoolExecutor(max_workers=0) längre fram.
+        raise RuntimeError(
+            "Ogiltig VC_LOCATION. Ange minst en plats i .env, flera separeras med semikolon "
+            "(VC_LOCATION=Kungsbacka;Göteborg)."
+        )
+
+    safe_key = API_KEY[:4] + "..." + API_KEY[-4:] if len(API_KEY) > 8 else "(kort)"
+    logging.info(
+        "Startar jobb – plats: %s, enheter: %s, VC_API_KEY: %s",
+        ", ".join(LOCATIONS), UNIT_GROUP, safe_key
+    )
 
 # ──────────────────────────────────────────────────────────────────────────────
 # DB-modell (SQLAlchemy ORM)
@@ -128,17 +168,127 @@ class WeatherHourly(Base):
     source = Column(String(32), default="VisualCrossing")
     fetched_at = Column(DateTime, server_default=func.current_timestamp())
 
+
+# UPSERT-satser som byggs en gång vid import.
+# Raderna laddas först med executemany till en oindexerad TEMP-tabell och förs
+# sedan över med en enda INSERT ... SELECT ... ON CONFLICT, så att index på
+# weather_hourly uppdateras i ett svep i stället för rad för rad.
+# Kolumner med server_default (fetched_at) utelämnas så att databasen sätter dem;
+# vid konflikt uppdateras alla kolumner utom primärnyckeln.
+PK_COLUMNS = ("location", "timestamp_local")
+UPSERT_COLUMNS = tuple(
+    col.name for col in WeatherHourly.__table__.columns if col.server_default is None
+)
+STAGE_TABLE = "tmp_weather_hourly"
+
+
+def _upsert_placeholder(col: str) -> str:
+    # SQLAlchemys DateTime lagras i SQLite som 'YYYY-MM-DD HH:MM:SS.ffffff'. Råa
+    # parametrar måste hamna i samma textformat, annars matchar inte PK-konflikten
+    # befintliga rader. Tidsstämpeln binds som text ('YYYY-MM-DD HH:MM:SS', se
+    # fetch_hours) – sqlite3:s inbyggda datetime-adapter är utfasad sedan 3.12 –
+    # och VC levererar hela sekunder, så mikrosekunderna nollställs.
+    if col == "timestamp_local":
+        return "strftime('%Y-%m-%d %H:%M:%S.000000', ?)"
+    return "?"
+
+
+_COLUMN_LIST = ", ".join(UPSERT_COLUMNS)
+
+STAGE_CREATE_SQL = (
+    f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} AS "
+    f"SELECT * FROM {WeatherHourly.__tablename__} WHERE 0"
+)
+STAGE_INSERT_SQL = (
+    f"INSERT INTO {STAGE_TABLE} ({_COLUMN_LIST}) "
+    f"VALUES ({', '.join(_upsert_placeholder(c) for c in UPSERT_COLUMNS)})"
+)
+# "WHERE true" krävs av SQLite för att ON CONFLICT inte ska tolkas som en JOIN-klausul.
+UPSERT_SQL = (
+    f"INSERT INTO {WeatherHourly.__tablename__} ({_COLUMN_LIST}) "
+    f"SELECT {_COLUMN_LIST} FROM {STAGE_TABLE} WHERE true "
+    f"ON CONFLICT({', '.join(PK_COLUMNS)}) DO UPDATE SET "
+    + ", ".join(
+        f"{col.name}=excluded.{col.name}"
+        for col in WeatherHourly.__table__.columns
+        if col.name not in PK_COLUMNS
+    )
+)
+STAGE_CLEAR_SQL = f"DELETE FROM {STAGE_TABLE}"
+
+# Uttrycksindex på (dag, plats) så att exportens GROUP BY DATE(timestamp_local),
+# location kan läsa i indexordning i stället för att sortera i en temp-B-tree.
+# Skapas efter create_all; SQL:en skiljer sig per dialekt.
+DAY_INDEX_DDL = {
+    "sqlite": (
+        "CREATE INDEX IF NOT EXISTS ix_weather_hourly_day_location "
+        "ON weather_hourly (DATE(timestamp_local), location)"
+    ),
+    "postgresql": (
+        "CREATE INDEX IF NOT EXISTS ix_weather_hourly_day_location "
+        "ON weather_hourly ((timestamp_local::date), location)"
+    ),
+}
+
+# Rader per executemany-anrop till TEMP-tabellen. executemany binder en rad i
+# taget, så SQLite:s gräns på 999 värdparametrar gäller per rad och inte per
+# batch; batchstorleken begränsar bara hur mycket som hålls i minnet per anrop.
+# Alla batchar delar samma transaktion.
+UPSERT_BATCH_ROWS = 500
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Hjälpfunktioner
 # ──────────────────────────────────────────────────────────────────────────────
 
+# SQLite-inställningar per anslutning: WAL + synchronous=NORMAL tar bort den
+# fulla fsync:en vid varje commit (säkert i WAL-läge; en krasch kan som mest
+# tappa senaste transaktionen, som ändå hämtas igen vid nästa körning).
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",     # vänta upp till 30 s på lås (i SQLite, inte i Python)
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",    # 256 MB minnesmappad I/O
+    "PRAGMA cache_size=-65536",      # ~64 MB sid-cache (negativt värde = KiB)
+)
+
+
+def set_sqlite_pragmas(pragmas: Iterable[str], dbapi_conn, _conn_record) -> None:
+    """
+    Sätter pragmas på en ny SQLite-anslutning. Registreras som "connect"-event
+    med pragmas bundna, t.ex. partial(set_sqlite_pragmas, SQLITE_PRAGMAS);
+    export_aggregate.py använder samma funktion med sina egna pragmas.
+    """
+    for pragma in pragmas:
+        dbapi_conn.execute(pragma)
+
+
+# Timeline-endpoint hos Visual Crossing: plats och datumintervall ligger i sökvägen.
+VC_TIMELINE_URL = (
+    "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/"
+    "timeline/{loc}/{start}/{end}"
+)
+
 # HTTP-statuskoder som är rimliga att försöka om (transienta fel)
 RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
+# Max antal platser som hämtas parallellt (nätverksbundet → trådar räcker).
+MAX_FETCH_WORKERS = 8
+
+# Delad HTTP-session: återanvänder TCP/TLS-anslutningen (keep-alive) mellan
+# anrop och retries. Egna retries sköts i fetch_with_retries → max_retries=0.
+# Poolen rymmer en anslutning per hämtningstråd.
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.headers.update({"Accept-Encoding": "gzip"})
+HTTP_SESSION.mount(
+    "https://",
+    HTTPAdapter(pool_connections=4, pool_maxsize=MAX_FETCH_WORKERS, max_retries=0),
+)
+
 
 def fetch_with_retries(url: str, params: Dict[str, str], max_attempts: int = 5) -> requests.Response:
     """
-    Gör ett HTTP GET-anrop med exponentiell backoff och hanterar vanliga fel.
+    Gör ett HTTP GET-anrop (via HTTP_SESSION) med exponentiell backoff och hanterar vanliga fel.
 
     - 401 → fail-fast (ingen idé att försöka igen utan rätt nyckel).
     - 429/5xx → retry med exponential backoff (tar hänsyn till "Retry-After" om det finns).
@@ -146,7 +296,7 @@ def fetch_with_retries(url: str, params: Dict[str, str], max_attempts: int = 5)
 
     Args:
         url:   API-endpoint.
-        params: Query-parametrar som skickas med requests.get.
+        params: Query-parametrar som skickas med HTTP_SESSION.get (timeout (5, 30)).
         max_attempts: Max antal försök innan vi ger upp.
 
     Returns:
@@ -158,7 +308,7 @@ def fetch_with_retries(url: str, params: Dict[str, str], max_attempts: int = 5)
     backoff = 1.0  # startfördröjning i sekunder
     for attempt in range(1, max_attempts + 1):
         try:
-            r = requests.get(url, params=params, timeout=30)
+            r = HTTP_SESSION.get(url, params=params, timeout=(5, 30))  # (connect, read)
             if r.status_code == 401:
                 logging.error("Unauthorized (401) – kontrollera VC_API_KEY. Svar: %s", r.text[:500])
                 r.raise_for_status()
@@ -195,36 +345,38 @@ def fetch_with_retries(url: str, params: Dict[str, str], max_attempts: int = 5)
     raise RuntimeError(f"Misslyckades efter {max_attempts} HTTP-försök")
 
 
-def combine_date_time(date_str: str, time_str: str) -> datetime:
+def combine_date_time(day: date, time_str: str) -> datetime:
     """
     Visual Crossing ger timmar som 'H:MM:SS' (ibland ensiffrig timme).
-    Denna funktion normaliserar till 'HH:MM:SS' och bygger en datetime.
+    Delarna tolkas med int() direkt, så '0' och '00' ger samma timme.
+    Datumet tas som redan tolkat date, så att fetch_hours tolkar det en gång
+    per dag och bara timdelen per rad.
 
     Exempel:
-        combine_date_time("2025-08-27", "0:05:00")
+        combine_date_time(date(2025, 8, 27), "0:05:00")
         → datetime(2025, 8, 27, 0, 5, 0)
     """
-    hour = time_str.split(":")[0]
-    if len(hour) == 1:  # gör '0:05:00' → '00:05:00'
-        time_str = "0" + time_str
-    return datetime.fromisoformat(f"{date_str} {time_str}")
+    hh, mm, ss = time_str.split(":")
+    return datetime(day.year, day.month, day.day, int(hh), int(mm), int(ss))
 
 
-def fetch_hours(location: str, unit_group: str) -> List[Dict]:
+def fetch_hours(location: str, unit_group: str) -> List[Tuple]:
     """
     Hämtar timrader för ett litet fönster ([igår, imorgon]).
     Det räcker för schemalagda körningar och minskar payload.
 
     Returns:
-        Lista av dictar som matchar WeatherHourly-kolumner (utom fetched_at).
+        Lista av tupler med värden i samma ordning som UPSERT_COLUMNS, så att de
+        kan bindas positionellt direkt i UPSERT_SQL. timestamp_local är text
+        ('YYYY-MM-DD HH:MM:SS') så att råa DB-API-anrop inte behöver sqlite3:s
+        datetime-adapter.
     """
-    end = datetime.now(timezone.utc) + timedelta(days=1)
-    start = datetime.now(timezone.utc) - timedelta(days=1)
+    now = datetime.now(timezone.utc)
+    start = (now - timedelta(days=1)).date()
+    end = (now + timedelta(days=1)).date()
 
-    url = (
-        "https://weather.visualcrossing.com/VisualCrossingWebServices/rest/services/"
-        f"timeline/{location}/{start.date()}/{end.date()}"
-    )
+    # Platsen URL-kodas (mellanslag, å/ä/ö, "/"), komma får stå kvar ("London,UK").
+    url = VC_TIMELINE_URL.format(loc=quote(location, safe=","), start=start, end=end)
     params = {
         "unitGroup": unit_group,
         "include": "hours,current",
@@ -241,109 +393,129 @@ def fetch_hours(location: str, unit_group: str) -> List[Dict]:
     r = fetch_with_retries(url, params)
 
     try:
-        data = r.json()
+        # orjson tolkar råa bytes direkt (C-implementation, snabbare än r.json()).
+        data = orjson.loads(r.content)
     except Exception:
         logging.error("Kunde inte tolka JSON. Svar (trunkerat): %s", r.text[:500])
         raise
 
     tz = data.get("timezone")
     days = data.get("days", [])
-    rows: List[Dict] = []
+    rows: List[Tuple] = []
 
     for d in days:
-        d_date = d.get("datetime")  # 'YYYY-MM-DD'
+        # Datumet ('YYYY-MM-DD') tolkas en gång per dag, timdelen per rad.
+        day = date.fromisoformat(d.get("datetime"))
         for h in d.get("hours", []):
-            t_local = combine_date_time(d_date, h.get("datetime"))
+            t_local = combine_date_time(day, h.get("datetime")).isoformat(" ")
             rows.append(
-                {
-                    "location": location,
-                    "timestamp_local": t_local,
-                    "timezone_name": tz,
-                    "temp": h.get("temp"),
-                    "feelslike": h.get("feelslike"),
-                    "humidity": h.get("humidity"),
-                    "precip": h.get("precip"),
-                    "precipprob": h.get("precipprob"),
-                    "windspeed": h.get("windspeed"),
-                    "windgust": h.get("windgust"),
-                    "pressure": h.get("pressure"),
-                    "cloudcover": h.get("cloudcover"),
-                    "conditions": h.get("conditions"),
-                    "icon": h.get("icon"),
-                    "source": "VisualCrossing",
-                }
+                (
+                    location,
+                    t_local,
+                    tz,
+                    h.get("temp"),
+                    h.get("feelslike"),
+                    h.get("humidity"),
+                    h.get("precip"),
+                    h.get("precipprob"),
+                    h.get("windspeed"),
+                    h.get("windgust"),
+                    h.get("pressure"),
+                    h.get("cloudcover"),
+                    h.get("conditions"),
+                    h.get("icon"),
+                    "VisualCrossing",
+                )
             )
 
     logging.info("Hämtade %d timrader.", len(rows))
     return rows
 
 
-def upsert_sqlite(engine: Engine, rows: List[Dict], max_attempts: int = 5) -> None:
+def fetch_locations(locations: List[str], unit_group: str) -> List[Tuple]:
+    """
+    Hämtar timrader för flera platser parallellt (ThreadPoolExecutor) och slår
+    ihop dem till en lista, så att allt kan skrivas i en enda UPSERT.
+
+    Ett fel för någon plats propageras (samma beteende som för en plats).
     """
-    Idempotent UPSERT i SQLite med backoff om databasen är låst.
+    if len(locations) == 1:
+        return fetch_hours(locations[0], unit_group)
+
+    with ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(locations))) as ex:
+        results = ex.map(lambda loc: fetch_hours(loc, unit_group), locations)
+        return [row for rows in results for row in rows]
 
-    Strategi:
-        - INSERT ... ON CONFLICT(location, timestamp_local) DO UPDATE
+
+def upsert_sqlite(engine: Engine, rows: Iterable[Tuple]) -> None:
+    """
+    Idempotent UPSERT i SQLite.
+
+    Strategi (allt i en transaktion):
+        - BEGIN IMMEDIATE tar skrivlåset direkt. Är databasen låst av en annan
+          process väntar SQLite själv (busy_timeout) i stället för en retry-loop
+          i Python.
+        - Raderna laddas med DB-API executemany till TEMP-tabellen STAGE_TABLE,
+          uppdelat i batchar om UPSERT_BATCH_ROWS rader.
+        - INSERT ... SELECT ... ON CONFLICT(location, timestamp_local) DO UPDATE
+          (UPSERT_SQL) för över allt till weather_hourly, varefter TEMP-tabellen töms.
         - Alla kolumner uppdateras utom primärnycklarna.
 
     Args:
         engine: SQLAlchemy Engine för mål-databasen.
-        rows:   Lista med rader att skriva.
-        max_attempts: Antal försök vid låsning.
+        rows:   Rader (tupler i UPSERT_COLUMNS-ordning) att skriva. Lista eller
+                annan iterable; läses i batchar med islice.
 
     Raises:
-        SQLAlchemyError: Vid permanenta DB-fel (loggas dessutom).
+        SQLAlchemyError: Vid DB-fel, t.ex. om låset inte släpps inom busy_timeout
+            (loggas dessutom).
     """
-    if not rows:
+    it = iter(rows)
+    batch = list(islice(it, UPSERT_BATCH_ROWS))
+    if not batch:
         logging.info("Inga rader att spara.")
         return
 
-    backoff = 0.5
-    for attempt in range(1, max_attempts + 1):
-        try:
-            with Session(engine) as session:
-                insert_stmt = sqlite_insert(WeatherHourly).values(rows)
-
-                # Bygg kolumn-dict för UPDATE-delen (obs: exkludera PK).
-                update_cols = {
-                    col.name: insert_stmt.excluded[col.name]
-                    for col in WeatherHourly.__table__.columns
-                    if col.name not in ("location", "timestamp_local")
-                }
-
-                stmt = insert_stmt.on_conflict_do_update(
-                    index_elements=[WeatherHourly.location, WeatherHourly.timestamp_local],
-                    set_=update_cols,
-                )
-
-                session.execute(stmt)
-                session.commit()
-
-            logging.info("UPSERT klart (%d rader).", len(rows))
-            return
-
-        except OperationalError as e:
-            # Vanligt i SQLite om en annan process skriver: "database is locked".
-            msg = str(e).lower()
-            if "database is locked" in msg or "busy" in msg:
-                delay = backoff + random.uniform(0, 0.25)
-                logging.warning(
-                    "SQLite låst – retry om %.2fs (försök %d/%d)", delay, attempt, max_attempts
-                )
-                time.sleep(delay)
-                backoff = min(backoff * 2, 5.0)
-                continue
-            logging.exception("DB OperationalError")
-            raise
+    n = 0
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            conn.exec_driver_sql(STAGE_CREATE_SQL)
+            while batch:
+                conn.exec_driver_sql(STAGE_INSERT_SQL, batch)
+                n += len(batch)
+                batch = list(islice(it, UPSERT_BATCH_ROWS))
+            conn.exec_driver_sql(UPSERT_SQL)
+            conn.exec_driver_sql(STAGE_CLEAR_SQL)
+
+        logging.info("UPSERT klart (%d rader).", n)
+
+    except OperationalError:
+        # T.ex. "database is locked" när busy_timeout har löpt ut.
+        logging.exception("DB OperationalError")
+        raise
 
-        except SQLAlchemyError:
-            logging.exception("SQLAlchemy-fel vid UPSERT")
-            raise
+    except SQLAlchemyError:
+        logging.exception("SQLAlchemy-fel vid UPSERT")
+        raise
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Huvudflöde
 # ──────────────────────────────────────────────────────────────────────────────
 
+def schema_is_current(conn) -> bool:
+    """
+    True om databasen redan har schemat i version SCHEMA_VERSION.
+
+    Markeringen ligger i själva databasen (SQLite: PRAGMA user_version), så en
+    raderad eller ny databasfil får alltid sitt schema skapat. För andra
+    databaser körs create_all varje gång (returnerar False).
+    """
+    if conn.dialect.name != "sqlite":
+        return False
+    return conn.exec_driver_sql("PRAGMA user_version").scalar() == SCHEMA_VERSION
+
+
 def main() -> int:
     """
     Startar DB-anslutning, hämtar data och skriver till tabellen.
@@ -351,26 +523,39 @@ def main() -> int:
     Returns:
         Exit-kod (0/1/2), se modulens docstring.
     """
+    _init_env()
+
     try:
         engine = create_engine(
             DB_URL,
             pool_pre_ping=True,  # testa anslutningen innan varje checkout
             connect_args={"check_same_thread": False, "timeout": 30},  # SQLite-friendly
         )
+        if DB_URL.startswith("sqlite"):
+            event.listen(engine, "connect", partial(set_sqlite_pragmas, SQLITE_PRAGMAS))
 
         # Snabb sanity check (ger tydligare init-fel vid t.ex. felaktig DB_URL).
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
-
-        # Skapa tabell första gången.
-        Base.metadata.create_all(engine)
+            schema_current = schema_is_current(conn)
+
+        # Skapa tabell första gången. Schemat ändras aldrig under körning, så
+        # create_all hoppas över när databasen redan har SCHEMA_VERSION.
+        if not schema_current:
+            Base.metadata.create_all(engine)
+            with engine.begin() as conn:
+                day_index_ddl = DAY_INDEX_DDL.get(engine.dialect.name)
+                if day_index_ddl:
+                    conn.exec_driver_sql(day_index_ddl)
+                if engine.dialect.name == "sqlite":
+                    conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
 
     except Exception as e:
         logging.exception("Misslyckades att initiera DB: %s", e)
         return 2
 
     try:
-        rows = fetch_hours(LOCATION, UNIT_GROUP)
+        rows = fetch_locations(LOCATIONS, UNIT_GROUP)
         upsert_sqlite(engine, rows)
         return 0
 
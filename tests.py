@@ -1,23 +1,31 @@
 """
 tests.py
 ========
-Enhetstester för main.py utan riktiga nätverksanrop eller extern DB.
+Enhetstester för main.py (och exportens filskrivare) utan riktiga nätverksanrop eller extern DB.
 - Nätverk mockas (ingen trafik mot Visual Crossing).
 - SQLite körs in-memory (snabbt och isolerat).
-- Tidsstämplar jämförs i intervall för att slippa mikrosekund-problem.
+- Tidsstämplar jämförs exakt (upsert lagrar dem med hela sekunder).
 
 Körning:
     (venv) python tests.py -v
+
+Med pytest + pytest-xdist installerat körs testklasserna parallellt
+(`-n auto --dist loadgroup`, se conftest.py); annars används unittest.
 """
 
 import os
+import sys
+import json
+import tempfile
 import unittest
-from unittest.mock import patch
-from datetime import timedelta
-from sqlalchemy import create_engine, text
-from sqlalchemy.pool import StaticPool
+from dataclasses import dataclass, field
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Any, Dict
+from requests import HTTPError
+from datetime import date, datetime, timedelta
 
-# Säkra att main.py inte klagar på API-nyckel/DB_URL vid import under test.
+# Förutsägbar konfiguration för main.py under test (läses vid import).
 os.environ.setdefault("VC_API_KEY", "TESTKEY123456")
 os.environ.setdefault("VC_LOCATION", "Kungsbacka")
 os.environ.setdefault("VC_UNIT_GROUP", "metric")
@@ -25,35 +33,100 @@ os.environ.setdefault("DATABASE_URL", "sqlite:///weather_test.db")
 
 # Importera applikationsmodulen efter att env satts.
 import main as app
+import export_aggregate as export
+
+# Mall för en väderrad i upsert-testerna (allt utom tidsstämpeln), byggd en gång.
+_BASE_ROW = {
+    "location": "Kungsbacka",
+    "timezone_name": "Europe/Stockholm",
+    "temp": 10.0, "feelslike": 9.0, "humidity": 80.0,
+    "precip": 0.0, "precipprob": 0.0, "windspeed": 2.0, "windgust": 4.0,
+    "pressure": 1015.0, "cloudcover": 50.0, "conditions": "Clear", "icon": "clear-night",
+    "source": "VisualCrossing",
+}
+
 
+def _as_row(d):
+    """Dict → tupel i UPSERT_COLUMNS-ordning (samma layout som fetch_hours ger)."""
+    return tuple(d[c] for c in app.UPSERT_COLUMNS)
 
+
+def _compile_ddl():
+    """
+    Schemats DDL kompilerad för SQLite, så att create_all inte behöver gå
+    igenom metadata för varje ny test-engine. SQLAlchemy-delarna importeras
+    här och inte på modulnivå (behövs bara av TestSQLiteUpsert).
+    """
+    from sqlalchemy.dialects import sqlite
+    from sqlalchemy.schema import CreateIndex, CreateTable
+
+    return tuple(
+        str(ddl.compile(dialect=sqlite.dialect()))
+        for t in app.Base.metadata.sorted_tables
+        for ddl in (CreateTable(t), *(CreateIndex(ix) for ix in t.indexes))
+    )
+
+
+# Verifierings-SELECT:ar (SQL-text; görs om till text() i TestSQLiteUpsert.setUpClass).
+# Likhet på hela primärnyckeln → direkt uppslag i PK-indexet.
+_SEL_TEMP_FEELS = """
+    SELECT temp, feelslike FROM weather_hourly
+    WHERE location = :loc AND timestamp_local = :ts
+"""
+_SEL_TEMP = """
+    SELECT temp FROM weather_hourly
+    WHERE location = :loc AND timestamp_local = :ts
+"""
+
+
+def _patch(test, obj, name, value):
+    """
+    Sätter obj.name = value och återställer via test.addCleanup.
+    Lättviktigt alternativ till mock.patch (ingen MagicMock per anrop).
+    """
+    if name in vars(obj):
+        test.addCleanup(setattr, obj, name, getattr(obj, name))
+    else:
+        # T.ex. en metod på klassen: ta bort instans-attributet efteråt.
+        test.addCleanup(delattr, obj, name)
+    setattr(obj, name, value)
+
+
+@dataclass(slots=True)
 class FakeResponse:
     """
     Minimal ersättning för requests.Response.
 
     Egenskaper:
         status_code – HTTP-status
+        json_data   – JSON som json() returnerar (None → json() höjer fel)
         text        – råtext
         headers     – valfria rubriker (t.ex. Retry-After)
+        content     – råa bytes (JSON-kodad json_data om satt, annars text)
     Metoder:
         json()            – returnerar json_data eller höjer fel om saknas
         raise_for_status()– höjer requests.HTTPError vid 4xx/5xx
     """
-    def __init__(self, status_code=200, json_data=None, text_data="", headers=None):
-        self.status_code = status_code
-        self._json = json_data
-        self.text = text_data
-        self.headers = headers or {}
+    status_code: int = 200
+    json_data: Any = None
+    text: str = ""
+    headers: Dict[str, str] = field(default_factory=dict)
+    content: bytes = field(init=False)
+
+    def __post_init__(self):
+        if self.json_data is not None:
+            self.content = json.dumps(self.json_data).encode()
+        else:
+            self.content = self.text.encode()
 
     def raise_for_status(self):
         if 400 <= self.status_code < 600:
-            from requests import HTTPError
             raise HTTPError(f"{self.status_code} error")
 
     def json(self):
-        if self._json is None:
+        if self.json_data is None:
             raise ValueError("No JSON set on FakeResponse")
-        return self._json
+        return self.json_data
 
 
 class TestHelpers(unittest.TestCase):
@@ -61,121 +134,237 @@ class TestHelpers(unittest.TestCase):
 
     def test_combine_date_time_normalizes_hour(self):
         """Säkerställ att '0:05:00' blir '00:05:00'."""
-        dt = app.combine_date_time("2025-08-27", "0:05:00")
+        dt = app.combine_date_time(date(2025, 8, 27), "0:05:00")
         self.assertEqual(dt.isoformat(sep=" "), "2025-08-27 00:05:00")
 
 
 class TestFetchWithRetries(unittest.TestCase):
     """Tester för HTTP-retrylogik."""
 
-    @patch("main.time.sleep", return_value=None)  # gör testerna snabbare (ingen faktisk väntan)
-    def test_retries_then_success(self, _sleep):
-        """500 → retry → 200 ska ge lyckat svar."""
-        seq = [
-            FakeResponse(500, text_data="server error", headers={"Retry-After": "0"}),
-            FakeResponse(200, json_data={"ok": True}),
-        ]
-        with patch("main.requests.get", side_effect=seq):
-            r = app.fetch_with_retries("http://example.com", {})
-            self.assertEqual(r.json()["ok"], True)
+    @classmethod
+    def setUpClass(cls):
+        # Gör testerna snabbare (ingen faktisk väntan i backoff).
+        cls.addClassCleanup(setattr, app.time, "sleep", app.time.sleep)
+        app.time.sleep = lambda *_: None
+
+    # (statuskoder i anropsordning, ska lyckas?) – 401 ska kasta direkt (ingen retry),
+    # 429/5xx ska ge retry tills ett 200-svar kommer.
+    CASES = (
+        ((500, 200), True),
+        ((401,), False),
+        ((503, 503, 200), True),
+        ((429, 200), True),
+    )
 
-    def test_unauthorized_raises(self):
-        """401 ska kasta direkt (ingen retry)."""
-        with patch("main.requests.get", return_value=FakeResponse(401, text_data="unauthorized")):
-            with self.assertRaises(Exception):
-                app.fetch_with_retries("http://example.com", {})
+    def test_status_sequences(self):
+        for statuses, ok in self.CASES:
+            with self.subTest(statuses=statuses):
+                # Generator → varje svar skapas först när det hämtas.
+                it = (
+                    FakeResponse(s, json_data={"ok": True}) if s == 200
+                    else FakeResponse(s, text=f"{s} error", headers={"Retry-After": "0"})
+                    for s in statuses
+                )
+                _patch(self, app.HTTP_SESSION, "get", lambda *a, **k: next(it))
+                if ok:
+                    r = app.fetch_with_retries("http://example.com", {})
+                    self.assertEqual(r.json()["ok"], True)
+                else:
+                    with self.assertRaises(HTTPError):
+                        app.fetch_with_retries("http://example.com", {})
+                # Alla svar ska ha förbrukats, inga extra anrop.
+                self.assertIsNone(next(it, None))
 
 
 class TestFetchHoursParsing(unittest.TestCase):
     """Parser-test: att vi gör om VC JSON → rader med rätt fält."""
 
     def test_parses_days_and_hours(self):
+        # En vecka med 24 timmar per dag (VC skriver timmen utan inledande nolla)
+        first_day = date(2025, 8, 26)
         fake_json = {
             "timezone": "Europe/Stockholm",
             "days": [
-                {"datetime": "2025-08-26",
+                {"datetime": (first_day + timedelta(days=i)).isoformat(),
                  "hours": [
-                     {"datetime": "0:00:00", "temp": 10, "feelslike": 9, "humidity": 80,
+                     {"datetime": f"{h}:00:00", "temp": 10 + h * 0.1, "feelslike": 9, "humidity": 80,
                       "precip": 0, "precipprob": 0, "windspeed": 2, "windgust": 4,
-                      "pressure": 1015, "cloudcover": 50, "conditions": "Clear", "icon": "clear-night"},
-                     {"datetime": "1:00:00", "temp": 9.5, "feelslike": 8.5, "humidity": 82,
-                      "precip": 0, "precipprob": 0, "windspeed": 3, "windgust": 5,
-                      "pressure": 1016, "cloudcover": 40, "conditions": "Clear", "icon": "clear-night"},
-                 ]},
-            ]
+                      "pressure": 1015, "cloudcover": 50, "conditions": "Clear", "icon": "clear-night"}
+                     for h in range(24)
+                 ]}
+                for i in range(7)
+            ],
         }
-        # Mocka HTTP-lagret så fetch_hours får exakt denna JSON
-        with patch("main.fetch_with_retries", return_value=FakeResponse(200, json_data=fake_json)):
-            rows = app.fetch_hours("Kungsbacka", "metric")
-            self.assertEqual(len(rows), 2)
-            self.assertEqual(rows[0]["location"], "Kungsbacka")
-            self.assertEqual(rows[0]["timezone_name"], "Europe/Stockholm")
-            self.assertIn("temp", rows[0])
-            self.assertIn("timestamp_local", rows[0])
+        # Ersätt HTTP-lagret så fetch_hours får exakt denna JSON (som bytes i content)
+        resp = FakeResponse(200, json_data=fake_json)
+        _patch(self, app, "fetch_with_retries", lambda url, params: resp)
+        rows = app.fetch_hours("Kungsbacka", "metric")
+        self.assertEqual(len(rows), 24 * 7)
+        # Raderna är tupler i UPSERT_COLUMNS-ordning
+        row = dict(zip(app.UPSERT_COLUMNS, rows[0]))
+        self.assertEqual(len(rows[0]), len(app.UPSERT_COLUMNS))
+        self.assertEqual(row["location"], "Kungsbacka")
+        self.assertEqual(row["timezone_name"], "Europe/Stockholm")
+        self.assertEqual(row["temp"], 10)
+        self.assertEqual(row["timestamp_local"], "2025-08-26 00:00:00")
+        last = dict(zip(app.UPSERT_COLUMNS, rows[-1]))
+        self.assertEqual(last["timestamp_local"], "2025-09-01 23:00:00")
+
+    def test_location_is_url_encoded(self):
+        """Mellanslag och å/ä/ö i platsnamnet ska URL-kodas i sökvägen."""
+        resp = FakeResponse(200, json_data={"timezone": "America/New_York", "days": []})
+        urls = []
+        _patch(self, app, "fetch_with_retries", lambda url, params: urls.append(url) or resp)
+        app.fetch_hours("New York", "metric")
+        self.assertIn("/timeline/New%20York/", urls[0])
+
+    def test_fetch_locations_merges_rows(self):
+        """Flera platser hämtas parallellt och slås ihop i platsordning."""
+        _patch(self, app, "fetch_hours", lambda loc, unit_group: [(loc, 1), (loc, 2)])
+        rows = app.fetch_locations(["Kungsbacka", "Göteborg"], "metric")
+        self.assertEqual([r[0] for r in rows], ["Kungsbacka"] * 2 + ["Göteborg"] * 2)
 
 
 class TestSQLiteUpsert(unittest.TestCase):
     """DB-test: upsert med senare uppdatering av samma PK."""
 
-    def setUp(self):
-        # In-memory SQLite + StaticPool → samma connection över hela testfallet.
-        self.engine = create_engine(
+    @classmethod
+    def setUpClass(cls):
+        # SQLAlchemy importeras först här så att övriga testklasser slipper det.
+        from sqlalchemy import DateTime, bindparam, create_engine, text
+        from sqlalchemy.pool import StaticPool
+
+        # In-memory SQLite + StaticPool → samma connection för alla tester i klassen.
+        # Schemat skapas en gång; varje test börjar med en tömd tabell. Inga
+        # test-pragmas: en in-memory-databas har redan journalen i minnet och
+        # ingen fsync att stänga av.
+        cls.engine = create_engine(
             "sqlite://",
             connect_args={"check_same_thread": False},
             poolclass=StaticPool,
         )
-        app.Base.metadata.create_all(self.engine)
+        with cls.engine.begin() as conn:
+            for ddl in _compile_ddl():
+                conn.exec_driver_sql(ddl)
+        # Verifierings-SELECT:ar byggs en gång (SQLAlchemy cachar den kompilerade formen).
+        # :ts binds som DateTime → samma textformat ('...HH:MM:SS.000000') som
+        # upsert_sqlite lagrar, så exakt likhet matchar.
+        ts_param = bindparam("ts", type_=DateTime)
+        cls.sel_temp_feels = text(_SEL_TEMP_FEELS).bindparams(ts_param)
+        cls.sel_temp = text(_SEL_TEMP).bindparams(ts_param)
+        # Verifieringsläsningar körs i AUTOCOMMIT (ingen BEGIN/COMMIT runt SELECT).
+        # Delar pool/anslutning med cls.engine.
+        cls.read_engine = cls.engine.execution_options(isolation_level="AUTOCOMMIT")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.dispose()
 
-    def tearDown(self):
-        self.engine.dispose()
+    def setUp(self):
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DELETE FROM weather_hourly")
 
     def test_insert_and_update(self):
         # 1) INSERT
-        ts = app.combine_date_time("2025-08-27", "00:00:00")
-        ts2 = ts + timedelta(seconds=1)  # intervalljämförelse undviker mikrosekund-mismatch
-
-        row1 = {
-            "location": "Kungsbacka",
-            "timestamp_local": ts,
-            "timezone_name": "Europe/Stockholm",
-            "temp": 10.0, "feelslike": 9.0, "humidity": 80.0,
-            "precip": 0.0, "precipprob": 0.0, "windspeed": 2.0, "windgust": 4.0,
-            "pressure": 1015.0, "cloudcover": 50.0, "conditions": "Clear", "icon": "clear-night",
-            "source": "VisualCrossing",
-        }
-        app.upsert_sqlite(self.engine, [row1])
-
-        with self.engine.connect() as conn:
-            v1 = conn.execute(
-                text("""
-                    SELECT temp, feelslike FROM weather_hourly
-                    WHERE location = :loc
-                      AND timestamp_local >= :ts
-                      AND timestamp_local < :ts2
-                """),
-                {"loc": "Kungsbacka", "ts": ts, "ts2": ts2},
-            ).fetchone()
+        ts = datetime(2025, 8, 27)
+
+        row1 = dict(_BASE_ROW, timestamp_local=ts.isoformat(" "))
+        params = {"loc": "Kungsbacka", "ts": ts}
+        app.upsert_sqlite(self.engine, [_as_row(row1)])
+
+        # Läsanslutningen stängs före nästa upsert: StaticPool delar den
+        # underliggande anslutningen, och en öppen AUTOCOMMIT-läsning skulle
+        # annars låta upserten köras med isolation_level=None.
+        with self.read_engine.connect() as conn:
+            v1 = conn.execute(self.sel_temp_feels, params).fetchone()
         self.assertIsNotNone(v1)
-        self.assertAlmostEqual(v1[0], 10.0)
+        self.assertEqual(v1[0], 10.0)
 
         # 2) UPDATE (samma PK, ändrad temp)
-        row1b = dict(row1)
-        row1b["temp"] = 12.5
-        app.upsert_sqlite(self.engine, [row1b])
-
-        with self.engine.connect() as conn:
-            v2 = conn.execute(
-                text("""
-                    SELECT temp FROM weather_hourly
-                    WHERE location = :loc
-                      AND timestamp_local >= :ts
-                      AND timestamp_local < :ts2
-                """),
-                {"loc": "Kungsbacka", "ts": ts, "ts2": ts2},
-            ).fetchone()
+        row1b = dict(row1, temp=12.5)
+        app.upsert_sqlite(self.engine, [_as_row(row1b)])
+
+        with self.read_engine.connect() as conn:
+            v2 = conn.execute(self.sel_temp, params).fetchone()
         self.assertIsNotNone(v2)
-        self.assertAlmostEqual(v2[0], 12.5)
+        self.assertEqual(v2[0], 12.5)
+
+    def test_many_rows_span_batches(self):
+        """Fler rader än en batch (från en generator) ska alla hamna i tabellen."""
+        n = app.UPSERT_BATCH_ROWS * 2 + 1
+        start = datetime(2025, 1, 1)
+        rows = (
+            _as_row(dict(
+                _BASE_ROW, timestamp_local=(start + timedelta(hours=i)).isoformat(" "), temp=float(i)
+            ))
+            for i in range(n)
+        )
+        app.upsert_sqlite(self.engine, rows)
+
+        with self.read_engine.connect() as conn:
+            count = conn.exec_driver_sql("SELECT COUNT(*) FROM weather_hourly").scalar()
+        self.assertEqual(count, n)
+
+
+class TestExportWriters(unittest.TestCase):
+    """Exportens filskrivare (write_csv/write_json) mot en temporär katalog."""
+
+    # Som mappings från aggregat-SQL:en; SQLite ger dagen som text, andra databaser som date.
+    ROWS = (
+        {"day": "2025-08-26", "location": "Kungsbacka", "temp_avg": 12.5, "hours_count": 24},
+        {"day": "2025-08-27", "location": "Kungsbacka", "temp_avg": 11.0, "hours_count": 24},
+        {"day": "2025-08-28", "location": "Kungsbacka", "temp_avg": 9.75, "hours_count": 23},
+    )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = Path(tmp.name)
+
+    def test_write_json_round_trips(self):
+        """Arrayen ska vara giltig JSON och motsvara raderna (0, 1 och flera rader)."""
+        for n in (0, 1, len(self.ROWS)):
+            with self.subTest(rows=n):
+                out = self.dir / f"daily_{n}.json"
+                self.assertEqual(export.write_json(out, self.ROWS[:n]), n)
+                text = out.read_text(encoding="utf-8")
+                self.assertEqual(json.loads(text), list(self.ROWS[:n]))
+                # Handbyggd array-inramning → samma layout som json.dump(indent=2).
+                self.assertEqual(text, json.dumps(list(self.ROWS[:n]), indent=2))
+
+    def test_write_json_formats_date(self):
+        out = self.dir / "daily.json"
+        export.write_json(out, [dict(self.ROWS[0], day=date(2025, 8, 26))])
+        self.assertEqual(json.loads(out.read_text(encoding="utf-8"))[0]["day"], "2025-08-26")
+
+    def test_write_csv_bom_header_and_iso_day(self):
+        """BOM + rubrikrad, och dagen som 'YYYY-MM-DD' både för str- och date-värden."""
+        fieldnames = list(self.ROWS[0])
+        for kind, day in (("str", "2025-08-26"), ("date", date(2025, 8, 26))):
+            with self.subTest(day=kind):
+                out = self.dir / f"daily_{kind}.csv"
+                rows = [dict(self.ROWS[0], day=day)]
+                self.assertEqual(export.write_csv(out, fieldnames, rows), 1)
+                raw = out.read_bytes()
+                self.assertTrue(raw.startswith(b"\xef\xbb\xbf"))
+                lines = raw.decode("utf-8-sig").splitlines()
+                self.assertEqual(lines, [
+                    "day,location,temp_avg,hours_count",
+                    "2025-08-26,Kungsbacka,12.5,24",
+                ])
+
+    def test_write_csv_empty_writes_header_only(self):
+        out = self.dir / "daily_empty.csv"
+        self.assertEqual(export.write_csv(out, list(self.ROWS[0]), []), 0)
+        self.assertEqual(out.read_text(encoding="utf-8-sig").splitlines(),
+                         ["day,location,temp_avg,hours_count"])
 
 
 if __name__ == "__main__":
+    # find_spec i stället för import: xdist får inte vara importerad innan
+    # pytest.main, annars kan pytest inte skriva om dess asserts (varning).
+    if find_spec("pytest") and find_spec("xdist"):
+        import pytest
+
+        raise SystemExit(pytest.main([__file__, "-n", "auto", "--dist", "loadgroup", *sys.argv[1:]]))
     unittest.main()